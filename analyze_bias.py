@@ -1,5 +1,4 @@
 # analyze_bias.py
-import json
 import re
 import argparse
 from pathlib import Path
@@ -10,6 +9,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from scipy import stats
 
+from result_sink import read_jsonl
+
 # Sentiment (VADER)
 # Requires: pip install nltk
 # First run will download lexicon if missing
@@ -43,12 +44,7 @@ def classify_focus(text):
         return "unclear"
 
 def load_jsonl(path: Path):
-    rows = []
-    with path.open(encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                rows.append(json.loads(line))
-    return pd.DataFrame(rows)
+    return pd.DataFrame(read_jsonl(path))
 
 def plot_sentiment(df, outdir: Path):
     fig, ax = plt.subplots(figsize=(7,4))
@@ -0,0 +1,279 @@
+# result_sink.py
+"""
+Buffered, sharded, crash-safe JSONL result writer.
+
+Each worker appends to its own shard under `<results stem>.shards/`. The active
+shard is named `<worker>-<seq>.jsonl.open`; on rotation (or close) it is flushed,
+fsynced and atomically renamed to `<worker>-<seq>.jsonl`. `compact()` merges the
+shards (and any existing log) into one sorted, deduplicated JSONL file.
+
+Usage:
+  python result_sink.py --results results/raw_responses.jsonl
+  python result_sink.py --results results/raw_responses.jsonl --include_open
+"""
+import os
+import re
+import json
+import uuid
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+OPEN_SUFFIX = ".open"
+LOCK_NAME = ".compact.lock"
+WORKER_ID_RE = re.compile(r"[A-Za-z0-9_.-]+")
+
+# ---------- Tolerant reader ----------
+def iter_jsonl(path: Path):
+    """
+    Yield records from a JSONL file, skipping a partial trailing line
+    (e.g. left behind by a crash mid-write). Corrupt lines elsewhere still raise.
+    """
+    # Decode per line: a crash can cut a record inside a multi-byte character.
+    with Path(path).open("rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                if line.endswith(b"\n"):
+                    raise
+                print(f"[WARN] Skipping partial trailing line in {path}")
+                continue
+            yield rec
+
+def read_jsonl(path: Path):
+    return list(iter_jsonl(path))
+
+# ---------- Filesystem helpers ----------
+def _fsync_dir(path: Path):
+    # Persist renames; not supported on every platform (e.g. Windows).
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _open_in_dir(path: Path, flags, mode=0o644):
+    # Recreate the directory if it disappears between mkdir and open.
+    for _ in range(3):
+        try:
+            return os.open(str(path), flags, mode)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(str(path), flags, mode)
+
+def shard_dir_for(out_path: Path) -> Path:
+    out_path = Path(out_path)
+    return out_path.with_name(out_path.stem + ".shards")
+
+def list_shards(out_path: Path, include_open=False):
+    shard_dir = shard_dir_for(out_path)
+    if not shard_dir.is_dir():
+        return []
+    shards = sorted(shard_dir.glob("*.jsonl"))
+    if include_open:
+        shards += sorted(shard_dir.glob("*.jsonl" + OPEN_SUFFIX))
+    return shards
+
+# ---------- Sharded writer ----------
+class ResultSink:
+    """
+    Per-worker buffered writer.
+
+    worker_id:   shard name prefix, limited to [A-Za-z0-9_.-] (default: pid plus a
+                 random suffix, so workers in different containers sharing the
+                 directory never collide).
+    batch_size:  records buffered before they are written and flushed; anything
+                 still buffered is lost on a crash (default 1: nothing is).
+    fsync_every: flushed batches between fsyncs (0 = only on rotation/close).
+    rotate_bytes: seal the active shard once it reaches this size (0 = never).
+    """
+
+    def __init__(self, out_path: Path, worker_id=None, batch_size=1,
+                 fsync_every=1, rotate_bytes=8 * 1024 * 1024):
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        if fsync_every < 0:
+            raise ValueError("fsync_every must be >= 0")
+        if rotate_bytes < 0:
+            raise ValueError("rotate_bytes must be >= 0")
+        if worker_id is None:
+            worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        worker_id = str(worker_id)
+        if not WORKER_ID_RE.fullmatch(worker_id) or ".." in worker_id or worker_id == ".":
+            raise ValueError(f"worker_id must match [A-Za-z0-9_.-]+ and not contain '..': {worker_id!r}")
+        self.worker_id = worker_id
+        self.shard_dir = shard_dir_for(out_path)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.fsync_every = fsync_every
+        self.rotate_bytes = rotate_bytes
+        self._buffer = []
+        self._batches_since_fsync = 0
+        self._seq = self._next_seq()
+        self._fh = None
+        self._open_shard()
+
+    def _next_seq(self):
+        prefix = self.worker_id + "-"
+        seqs = []
+        try:
+            entries = list(self.shard_dir.iterdir())
+        except FileNotFoundError:
+            entries = []
+        for p in entries:
+            name = p.name
+            if name.endswith(OPEN_SUFFIX):
+                name = name[:-len(OPEN_SUFFIX)]
+            if name.startswith(prefix) and name.endswith(".jsonl"):
+                seq = name[len(prefix):-len(".jsonl")]
+                if seq.isdigit():
+                    seqs.append(int(seq))
+        return max(seqs) + 1 if seqs else 0
+
+    def _shard_path(self):
+        return self.shard_dir / f"{self.worker_id}-{self._seq:05d}.jsonl"
+
+    def _open_shard(self):
+        path = self._shard_path()
+        self._open_path = path.with_name(path.name + OPEN_SUFFIX)
+        fd = _open_in_dir(self._open_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        self._fh = os.fdopen(fd, "a", encoding="utf-8")
+
+    def _seal_shard(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        self._fh = None
+        self._batches_since_fsync = 0
+        if self._open_path.stat().st_size == 0:
+            self._open_path.unlink()
+        else:
+            os.replace(self._open_path, self._shard_path())
+            _fsync_dir(self.shard_dir)
+
+    def write(self, record: dict):
+        self._buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self._fh.write("".join(self._buffer))
+        self._fh.flush()
+        self._buffer.clear()
+        self._batches_since_fsync += 1
+        if self.fsync_every and self._batches_since_fsync >= self.fsync_every:
+            os.fsync(self._fh.fileno())
+            self._batches_since_fsync = 0
+        if self.rotate_bytes and self._fh.tell() >= self.rotate_bytes:
+            self._seal_shard()
+            self._seq += 1
+            self._open_shard()
+
+    def close(self):
+        if self._fh is None:
+            return
+        self.flush()
+        self._seal_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# ---------- Compaction ----------
+class CompactionInProgress(RuntimeError):
+    pass
+
+@contextmanager
+def _compaction_lock(shard_dir: Path):
+    # An OS-level lock is released when its holder dies, so a killed compaction
+    # never blocks later ones. The lock file itself is left in place.
+    lock_path = shard_dir / LOCK_NAME
+    fd = _open_in_dir(lock_path, os.O_RDWR | os.O_CREAT)
+    try:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise CompactionInProgress(f"{lock_path} is held by another compaction") from None
+        yield
+    finally:
+        os.close(fd)
+
+def _record_key(rec, src):
+    if not isinstance(rec, dict):
+        raise ValueError(f"{src}: expected a JSON object per line, got {type(rec).__name__}")
+    return rec.get("id") or json.dumps(rec, sort_keys=True, ensure_ascii=False)
+
+def compact(out_path: Path, include_open=False):
+    """
+    Merge shards and the existing log at `out_path` into one file sorted by
+    (timestamp, id) with duplicate ids dropped. The log is replaced atomically
+    and merged shards are removed afterwards, so re-running after a crash in
+    between only re-merges records that dedup drops. Holds an exclusive lock
+    on a file in the shard directory; raises CompactionInProgress if it is
+    taken. The shard directory is kept, since workers may be writing to it.
+    Returns the record count.
+    """
+    out_path = Path(out_path)
+    with _compaction_lock(shard_dir_for(out_path)):
+        return _compact_locked(out_path, include_open)
+
+def _compact_locked(out_path: Path, include_open):
+    shards = list_shards(out_path, include_open=include_open)
+    sources = ([out_path] if out_path.exists() else []) + shards
+
+    merged = {}
+    for src in sources:
+        for rec in iter_jsonl(src):
+            merged.setdefault(_record_key(rec, src), rec)
+    records = sorted(merged.values(), key=lambda r: (str(r.get("timestamp", "")), str(r.get("id", ""))))
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f"{out_path.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, out_path)
+    _fsync_dir(out_path.parent)
+
+    for shard in shards:
+        shard.unlink(missing_ok=True)
+    return len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact result shards into one sorted, deduplicated JSONL log.")
+    parser.add_argument("--results", type=str, default="results/raw_responses.jsonl", help="Compacted JSONL log path")
+    parser.add_argument("--include_open", action="store_true",
+                        help="Also merge unsealed shards (only when no worker is still running, e.g. after a crash)")
+    args = parser.parse_args()
+
+    try:
+        n = compact(Path(args.results), include_open=args.include_open)
+    except CompactionInProgress as e:
+        raise SystemExit(f"[ERROR] {e}")
+    print(f"[OK] Compacted {n} records → {args.results}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 # run_experiment.py
 import os
 import time
-import json
 import uuid
 import argparse
 from pathlib import Path
 from datetime import datetime
 
+from result_sink import ResultSink, CompactionInProgress, compact
+
 # ---------- Optional real API clients ----------
 def call_openai(prompt, temperature=0.3, model="gpt-4o-mini"):
     """
@@ -123,6 +124,13 @@ def main():
     parser.add_argument("--openai_model", type=str, default="gpt-4o-mini")
     parser.add_argument("--anthropic_model", type=str, default="claude-3-sonnet-20240229")
     parser.add_argument("--gemini_model", type=str, default="gemini-1.5-pro")
+    parser.add_argument("--worker_id", type=str, default=None, help="Shard name for this worker, letters/digits/_.- only (default: process id + random suffix)")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Records buffered before each write; up to batch_size-1 responses are lost on a crash")
+    parser.add_argument("--fsync_every", type=int, default=1, help="Batches between fsyncs (0 = only on rotation/close)")
+    parser.add_argument("--rotate_bytes", type=int, default=8 * 1024 * 1024, help="Seal and rotate a shard at this size (0 = never)")
+    parser.add_argument("--no_compact", action="store_true",
+                        help="Leave shards for a later `python result_sink.py` (use when running several workers)")
     args = parser.parse_args()
 
     prompt_dir = Path(args.prompt_dir)
@@ -140,7 +148,12 @@ def main():
         "mock": {"model": "mock-llm"},
     }
 
-    with out_path.open("a", encoding="utf-8") as f:
+    try:
+        sink = ResultSink(out_path, worker_id=args.worker_id, batch_size=args.batch_size,
+                          fsync_every=args.fsync_every, rotate_bytes=args.rotate_bytes)
+    except ValueError as e:
+        parser.error(str(e))
+    with sink:
         for pr in prompts:
             prompt_text = pr["path"].read_text(encoding="utf-8")
             for m in args.models:
@@ -166,9 +179,16 @@ def main():
                         "prompt_text": prompt_text,
                         "response_text": response,
                     }
-                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    sink.write(record)
                     time.sleep(0.2)  # polite pacing
                     print(f"[OK] {pr['hypothesis']} / {pr['variant']} / {m} run {i+1}")
 
+    if not args.no_compact:
+        try:
+            n = compact(out_path)
+            print(f"[OK] Compacted {n} records → {out_path}")
+        except CompactionInProgress as e:
+            print(f"[WARN] Skipping compaction: {e}")
+
 if __name__ == "__main__":
     main()
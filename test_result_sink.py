@@ -0,0 +1,168 @@
+# test_result_sink.py
+import json
+import shutil
+
+import pytest
+
+import result_sink
+from result_sink import (
+    CompactionInProgress, LOCK_NAME, ResultSink, compact, iter_jsonl,
+    list_shards, read_jsonl, shard_dir_for,
+)
+
+def _rec(i, ts=None, text="ok"):
+    return {"id": f"r{i}", "timestamp": ts or f"2025-01-01T00:00:{i:02d}", "response_text": text}
+
+def _line(rec):
+    return (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+# ---------- Reader ----------
+def test_partial_trailing_line_is_skipped(tmp_path):
+    p = tmp_path / "log.jsonl"
+    p.write_bytes(_line(_rec(1)) + b'{"id": "r2", "respo')
+    assert [r["id"] for r in iter_jsonl(p)] == ["r1"]
+
+def test_partial_trailing_line_cut_inside_utf8_char_is_skipped(tmp_path):
+    p = tmp_path / "log.jsonl"
+    partial = _line(_rec(2, text="café"))
+    cut = partial[:partial.index("é".encode("utf-8")) + 1]  # first byte of "é" only
+    p.write_bytes(_line(_rec(1, text="naïve — ok")) + cut)
+    rows = read_jsonl(p)
+    assert [r["id"] for r in rows] == ["r1"]
+    assert rows[0]["response_text"] == "naïve — ok"
+
+def test_corrupt_middle_line_raises(tmp_path):
+    p = tmp_path / "log.jsonl"
+    p.write_bytes(_line(_rec(1)) + b'{"id": "broken\n' + _line(_rec(3)))
+    with pytest.raises(json.JSONDecodeError):
+        read_jsonl(p)
+
+# ---------- Writer ----------
+def test_close_seals_open_shard(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    sink = ResultSink(out, worker_id="w1", batch_size=2)
+    sink.write(_rec(1))
+    shard_dir = shard_dir_for(out)
+    assert [p.name for p in shard_dir.iterdir()] == ["w1-00000.jsonl.open"]
+    sink.close()
+    assert [p.name for p in shard_dir.iterdir()] == ["w1-00000.jsonl"]
+    assert read_jsonl(shard_dir / "w1-00000.jsonl") == [_rec(1)]
+
+def test_rotation_at_rotate_bytes(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    size = len(_line(_rec(1)))
+    with ResultSink(out, worker_id="w1", batch_size=1, rotate_bytes=2 * size) as sink:
+        for i in range(5):
+            sink.write(_rec(i))
+    names = sorted(p.name for p in list_shards(out))
+    assert names == ["w1-00000.jsonl", "w1-00001.jsonl", "w1-00002.jsonl"]
+    assert [len(read_jsonl(shard_dir_for(out) / n)) for n in names] == [2, 2, 1]
+
+def test_default_batch_size_writes_each_record(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    with ResultSink(out, worker_id="w1") as sink:
+        sink.write(_rec(1))
+        assert read_jsonl(shard_dir_for(out) / "w1-00000.jsonl.open") == [_rec(1)]
+
+def test_shard_dir_removed_before_open(tmp_path, monkeypatch):
+    out = tmp_path / "raw.jsonl"
+    real_open = result_sink.os.open
+
+    def open_after_rmdir(path, *args):
+        # Simulate another process removing the directory after mkdir.
+        shutil.rmtree(shard_dir_for(out), ignore_errors=True)
+        monkeypatch.setattr(result_sink.os, "open", real_open)
+        return real_open(path, *args)
+
+    monkeypatch.setattr(result_sink.os, "open", open_after_rmdir)
+    with ResultSink(out, worker_id="w1") as sink:
+        sink.write(_rec(1))
+    assert read_jsonl(shard_dir_for(out) / "w1-00000.jsonl") == [_rec(1)]
+
+def test_shard_dir_removed_during_rotation(tmp_path, monkeypatch):
+    out = tmp_path / "raw.jsonl"
+    shard_dir = shard_dir_for(out)
+    sealed = []
+
+    def compact_and_rmdir(path):
+        # Runs between the seal rename and opening the next shard.
+        for shard in list_shards(out):
+            sealed.extend(read_jsonl(shard))
+        shutil.rmtree(shard_dir)
+
+    monkeypatch.setattr(result_sink, "_fsync_dir", compact_and_rmdir)
+    with ResultSink(out, worker_id="w1", rotate_bytes=1) as sink:
+        sink.write(_rec(1))
+        sink.write(_rec(2))
+    assert sealed == [_rec(1), _rec(2)]
+
+def test_default_worker_ids_are_unique(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    with ResultSink(out) as a, ResultSink(out) as b:
+        assert a.worker_id != b.worker_id
+
+@pytest.mark.parametrize("kwargs", [
+    {"batch_size": 0}, {"fsync_every": -1}, {"rotate_bytes": -1},
+    {"worker_id": "../../evil"}, {"worker_id": "host/1"}, {"worker_id": ".."},
+    {"worker_id": "a b"}, {"worker_id": ""},
+])
+def test_invalid_settings_rejected(tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        ResultSink(tmp_path / "raw.jsonl", **kwargs)
+
+# ---------- Compaction ----------
+def test_compact_dedups_and_sorts(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    out.write_bytes(_line(_rec(3)) + _line(_rec(1)))
+    with ResultSink(out, worker_id="w1") as sink:
+        sink.write(_rec(2))
+        sink.write(_rec(1))
+    assert compact(out) == 3
+    assert [r["id"] for r in read_jsonl(out)] == ["r1", "r2", "r3"]
+    assert list_shards(out) == []
+
+def test_compact_include_open(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    shard_dir = shard_dir_for(out)
+    shard_dir.mkdir()
+    (shard_dir / "w1-00000.jsonl.open").write_bytes(_line(_rec(1)) + b'{"id": "r2"')
+    assert compact(out) == 0
+    assert compact(out, include_open=True) == 1
+    assert [r["id"] for r in read_jsonl(out)] == ["r1"]
+
+def test_compact_rerun_after_crash_before_unlink(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    with ResultSink(out, worker_id="w1") as sink:
+        sink.write(_rec(1))
+    shard = list_shards(out)[0]
+    kept = shard.read_bytes()
+    compact(out)
+    # Simulate a crash after os.replace but before the shard was unlinked.
+    shard.write_bytes(kept)
+    assert compact(out) == 1
+    assert [r["id"] for r in read_jsonl(out)] == ["r1"]
+    assert not any(tmp_path.glob("*.tmp"))
+
+def test_compact_refuses_while_locked(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    with ResultSink(out, worker_id="w1") as sink:
+        sink.write(_rec(1))
+    with result_sink._compaction_lock(shard_dir_for(out)):
+        with pytest.raises(CompactionInProgress):
+            compact(out)
+    assert list_shards(out)
+    assert compact(out) == 1
+
+def test_leftover_lock_file_does_not_block(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    with ResultSink(out, worker_id="w1") as sink:
+        sink.write(_rec(1))
+    # A killed compaction leaves the file behind but not the OS lock.
+    (shard_dir_for(out) / LOCK_NAME).write_text("12345")
+    assert compact(out) == 1
+
+def test_compact_rejects_non_object_records(tmp_path):
+    out = tmp_path / "raw.jsonl"
+    out.write_bytes(_line(_rec(1)) + b"[1, 2]\n")
+    with pytest.raises(ValueError, match="raw.jsonl: expected a JSON object"):
+        compact(out)
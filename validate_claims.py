@@ -1,9 +1,10 @@
-import json
 import argparse
 from pathlib import Path
 import re
 import csv
 
+from result_sink import iter_jsonl
+
 GROUND_TRUTH = {
     "Player A": {"goals": 45, "assists": 20, "turnovers": 10},
     "Player B": {"goals": 38, "assists": 35, "turnovers": 8},
@@ -57,19 +58,15 @@ def main():
     out.parent.mkdir(parents=True, exist_ok=True)
 
     rows = []
-    with path.open(encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            rec = json.loads(line)
-            issues = validate_text(rec["response_text"])
-            rows.append({
-                "id": rec["id"],
-                "model": rec["model"],
-                "hypothesis": rec["hypothesis"],
-                "variant": rec["variant"],
-                "issues": "; ".join(issues) if issues else "None"
-            })
+    for rec in iter_jsonl(path):
+        issues = validate_text(rec["response_text"])
+        rows.append({
+            "id": rec["id"],
+            "model": rec["model"],
+            "hypothesis": rec["hypothesis"],
+            "variant": rec["variant"],
+            "issues": "; ".join(issues) if issues else "None"
+        })
 
     # Save CSV
     with out.open("w", newline="", encoding="utf-8") as csvfile: